@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+PLUS CONTROL - DEDUPLICACIÓN DE DOCUMENTOS ANTES DE SUBIR
+=========================================================
+Detecta documentos repetidos (rut_emisor, tipo_dte, folio) dentro de un
+archivo y entre los archivos de una misma corrida, ANTES de enviarlos a
+Supabase, para que cada documento viaje una sola vez.
+
+Cada documento se indexa por su llave en un diccionario y se compara con
+una huella (hash) de su contenido:
+- Misma llave y misma huella: repetición exacta, se descarta en silencio.
+- Misma llave y distinta huella: rectificación (p.ej. montos corregidos en
+  una descarga RCV posterior). Se resuelve según la política elegida.
+
+Políticas:
+    primero    Se queda la primera versión vista
+    ultimo     Se queda la versión vista más tarde (el orden de los archivos manda)
+    conflicto  No se sube ninguna versión; el documento queda en el informe
+
+Uso:
+    from deduplicar_dte import deduplicar, escribir_informe
+
+    filas, conflictos, repetidos = deduplicar(registros, politica='ultimo')
+"""
+
+import csv
+import hashlib
+import json
+
+POLITICAS = ('primero', 'ultimo', 'conflicto')
+POLITICA_DEFECTO = 'ultimo'
+
+CAMPOS_LLAVE = ('rut_emisor', 'tipo_dte', 'folio')
+# Campos que no describen al documento sino a la importación
+CAMPOS_IGNORADOS = ('importado_desde',)
+
+
+def llave_documento(datos):
+    return tuple(datos.get(campo) for campo in CAMPOS_LLAVE)
+
+
+def huella_documento(datos):
+    """Hash estable del contenido del documento"""
+    contenido = {k: v for k, v in datos.items() if k not in CAMPOS_IGNORADOS}
+    serializado = json.dumps(contenido, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(serializado.encode('utf-8')).hexdigest()
+
+
+def deduplicar(registros, politica=POLITICA_DEFECTO):
+    """
+    Resuelve duplicados en una lista de (origen, datos).
+
+    origen es un texto libre para el informe, p.ej. "enero.csv:15".
+    Devuelve (filas, conflictos, repetidos):
+        filas       lista de datos a subir, una por documento, en orden de aparición
+        conflictos  lista de dicts con cada versión de los documentos rectificados
+        repetidos   cantidad de repeticiones exactas descartadas
+    """
+    if politica not in POLITICAS:
+        raise ValueError(f"Política '{politica}' no válida. Opciones: {', '.join(POLITICAS)}")
+
+    # llave -> {huella: version}; cada versión recuerda la primera y la última
+    # posición en que apareció, para que una repetición posterior (A, B, A)
+    # cuente como la versión más reciente
+    versiones = {}
+    repetidos = 0
+
+    for posicion, (origen, datos) in enumerate(registros):
+        vistas = versiones.setdefault(llave_documento(datos), {})
+        huella = huella_documento(datos)
+        version = vistas.get(huella)
+        if version is not None:
+            repetidos += 1
+            version['origenes'].append(origen)
+            version['ultima'] = posicion
+            continue
+        vistas[huella] = {'datos': datos, 'origenes': [origen], 'primera': posicion, 'ultima': posicion}
+
+    filas = []
+    conflictos = []
+    for llave, vistas in versiones.items():
+        if len(vistas) == 1:
+            filas.append(next(iter(vistas.values()))['datos'])
+            continue
+
+        if politica == 'primero':
+            elegida = min(vistas, key=lambda h: vistas[h]['primera'])
+        elif politica == 'ultimo':
+            elegida = max(vistas, key=lambda h: vistas[h]['ultima'])
+        else:
+            elegida = None
+
+        if elegida is not None:
+            filas.append(vistas[elegida]['datos'])
+
+        for huella, version in sorted(vistas.items(), key=lambda v: v[1]['primera']):
+            contenido = {k: v for k, v in version['datos'].items()
+                         if k not in CAMPOS_LLAVE and k not in CAMPOS_IGNORADOS}
+            conflictos.append({
+                'rut_emisor': llave[0],
+                'tipo_dte': llave[1],
+                'folio': llave[2],
+                'origen': ', '.join(version['origenes']),
+                'huella': huella[:12],
+                **contenido,
+                'resolucion': 'SUBIDA' if huella == elegida else 'DESCARTADA',
+            })
+
+    return filas, conflictos, repetidos
+
+
+def escribir_informe(conflictos, ruta):
+    """Guarda el informe de conflictos como CSV (mismo formato que el SII: ';' y latin1)"""
+    columnas = []
+    for conflicto in conflictos:
+        columnas.extend(c for c in conflicto if c not in columnas)
+    columnas.remove('resolucion')
+    columnas.append('resolucion')
+    with open(ruta, 'w', newline='', encoding='latin1', errors='replace') as f:
+        escritor = csv.DictWriter(f, fieldnames=columnas, delimiter=';')
+        escritor.writeheader()
+        escritor.writerows(conflictos)
+
+
+def documentos_retenidos(conflictos):
+    """Llaves de los documentos de los que no se sube ninguna versión"""
+    llaves = {(c['rut_emisor'], c['tipo_dte'], c['folio']) for c in conflictos}
+    subidas = {(c['rut_emisor'], c['tipo_dte'], c['folio']) for c in conflictos if c['resolucion'] == 'SUBIDA'}
+    return llaves - subidas
+
+
+def resumen(total, filas, conflictos, repetidos):
+    documentos = len({(c['rut_emisor'], c['tipo_dte'], c['folio']) for c in conflictos})
+    return (
+        f"🧹 Deduplicación: {total} líneas → {len(filas)} documentos a subir "
+        f"({repetidos} repeticiones exactas, {documentos} documentos con versiones distintas)"
+    )
+
@@ -1,42 +1,17 @@
 #!/usr/bin/env python3
+import argparse
 import pandas as pd
-import sys
 import re
 from datetime import datetime
-from supabase import create_client, Client
-from dotenv import load_dotenv
-import os
 from pathlib import Path
+from transporte_supabase import ERRORES_TRANSPORTE, obtener_transporte
+from deduplicar_dte import POLITICAS, POLITICA_DEFECTO, deduplicar, documentos_retenidos, escribir_informe
+from deduplicar_dte import resumen as resumen_dedup
 
-# --- INICIO DE LA CORRECCIÓN DE RUTA ---
-# Esto obliga a Python a buscar el .env en la carpeta "scripts"
 ruta_script = Path(__file__).parent
-ruta_env = ruta_script / '.env'
 
-print(f"🔍 Buscando archivo .env en: {ruta_env}")
-load_dotenv(dotenv_path=ruta_env)
-# ---------------------------------------
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-# Depuración: Ver qué está leyendo (sin mostrar la llave completa)
-if not SUPABASE_URL:
-    print("❌ ERROR: No se encontró SUPABASE_URL")
-else:
-    print(f"✅ URL encontrada: {SUPABASE_URL[:20]}...")
-
-if not SUPABASE_KEY:
-    print("❌ ERROR: No se encontró SUPABASE_KEY")
-else:
-    print("✅ KEY encontrada.")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("\n⚠️  EL ARCHIVO .env PARECE ESTAR VACÍO O NO SE LEE.")
-    print("   Por favor abre 'scripts/.env' y asegúrate de guardar los cambios (Ctrl+S).")
-    sys.exit(1)
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Conexión compartida (pool keep-alive + gzip), configurada desde scripts/.env
+transporte = obtener_transporte()
 
 # --- FIN CONFIGURACIÓN ---
 
@@ -58,7 +33,7 @@ def parsear_monto(monto):
     except:
         return 0.0
 
-def importar_csv(archivo_csv):
+def leer_csv(archivo_csv):
     ruta_csv = Path(archivo_csv)
     # Si no encuentra el CSV, intenta buscarlo en la misma carpeta del script
     if not ruta_csv.exists():
@@ -77,7 +52,7 @@ def importar_csv(archivo_csv):
         print(f"✅ Archivo leído. Columnas: {len(df.columns)}")
     except Exception as e:
         print(f"❌ Error leyendo CSV: {e}")
-        return
+        return []
 
     mapeo = {
         'Tipo Doc': 'tipo_dte',
@@ -105,9 +80,9 @@ def importar_csv(archivo_csv):
 
     print("🔄 Procesando datos...")
     
-    registros_exitosos = 0
+    registros = []
     
-    for _, row in df.iterrows():
+    for idx, row in df.iterrows():
         try:
             if pd.isna(row['rut_emisor']) or pd.isna(row['folio']): continue
 
@@ -125,18 +100,71 @@ def importar_csv(archivo_csv):
                 'importado_desde': 'CSV_MANUAL'
             }
             
-            supabase.table('compras_sii').insert(datos).execute()
-            registros_exitosos += 1
-            print(f"   ✅ Factura {datos['folio']} importada.")
+            # +2: cabecera y numeración desde 1, igual que al abrir el CSV
+            registros.append((f"{ruta_csv.name}:{idx + 2}", datos))
             
         except Exception as e:
-            if "duplicate key" not in str(e):
-                print(f"   ⚠️ Error en fila: {e}")
+            print(f"   ⚠️ Error en fila: {e}")
 
-    print(f"\n🎉 ¡LISTO! Se importaron {registros_exitosos} facturas nuevas.")
+    return registros
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Uso: python importar_compras_sii.py NOMBRE_ARCHIVO.csv")
+# --- CLI Y SUBIDA (compartidos con importar_directo.py e importar_final.py) ---
+
+def crear_parser(descripcion, archivo_defecto=None):
+    """Argumentos comunes de los importadores: archivos CSV y --politica"""
+    parser = argparse.ArgumentParser(description=descripcion)
+    if archivo_defecto:
+        parser.add_argument('archivos', nargs='*', default=[archivo_defecto], metavar='NOMBRE_ARCHIVO.csv',
+                            help=f"Archivos a importar (por defecto {archivo_defecto})")
     else:
-        importar_csv(sys.argv[1])
\ No newline at end of file
+        parser.add_argument('archivos', nargs='+', metavar='NOMBRE_ARCHIVO.csv')
+    parser.add_argument('--politica', choices=POLITICAS, default=POLITICA_DEFECTO,
+                        help="Qué versión subir cuando un documento aparece con datos distintos")
+    return parser
+
+def subir(registros, politica, origen_importacion, transporte, tabla='compras_sii'):
+    """
+    Deduplica los registros de toda la corrida y sube cada documento una vez.
+
+    Devuelve (insertadas, fallidas, retenidos): fallidas como insertar_en_lotes,
+    retenidos la cantidad de documentos que la política 'conflicto' no subió.
+    """
+    filas, conflictos, repetidos = deduplicar(registros, politica=politica)
+    print(resumen_dedup(len(registros), filas, conflictos, repetidos))
+
+    retenidos = len(documentos_retenidos(conflictos))
+    if conflictos:
+        ruta_informe = f"conflictos_{origen_importacion.lower()}_{datetime.now():%Y%m%d_%H%M%S}.csv"
+        escribir_informe(conflictos, ruta_informe)
+        print(f"⚠️ Documentos con versiones distintas (política '{politica}'). Informe: {ruta_informe}")
+
+    print(f"📤 Enviando {len(filas)} facturas en lotes...")
+    try:
+        insertadas, fallidas = transporte.insertar_en_lotes(
+            tabla, filas,
+            on_conflict='rut_emisor,tipo_dte,folio',
+            columna_retorno='folio'
+        )
+    except ERRORES_TRANSPORTE as e:
+        print(f"❌ Importación detenida, el servidor no acepta más lotes: {e}")
+        print(transporte.resumen())
+        raise SystemExit(1)
+    print(transporte.resumen())
+    if fallidas:
+        print(f"❌ {len(fallidas)} facturas NO se importaron (ver detalle arriba).")
+    if retenidos:
+        print(f"❌ {retenidos} documentos retenidos por conflicto, NO se subieron (ver informe).")
+    return insertadas, fallidas, retenidos
+
+if __name__ == "__main__":
+    parser = crear_parser("Importa uno o más CSV RCV del SII a compras_sii")
+    args = parser.parse_args()
+
+    registros = []
+    for archivo in args.archivos:
+        registros.extend(leer_csv(archivo))
+
+    registros_exitosos, fallidas, retenidos = subir(registros, args.politica, 'CSV_MANUAL', transporte)
+    print(f"\n🎉 ¡LISTO! Se importaron {registros_exitosos} facturas nuevas.")
+    if fallidas or retenidos:
+        raise SystemExit(1)
\ No newline at end of file
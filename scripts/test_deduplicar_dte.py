@@ -0,0 +1,65 @@
+import csv
+
+from deduplicar_dte import deduplicar, documentos_retenidos, escribir_informe
+
+
+def factura(monto_total, **extra):
+    datos = {
+        'rut_emisor': '85.655.500-3',
+        'tipo_dte': 33,
+        'folio': 266728,
+        'razon_social_emisor': 'DISTRIBUIDORA FURET LTDA.',
+        'monto_total': monto_total,
+        'importado_desde': 'CSV_MANUAL',
+    }
+    datos.update(extra)
+    return datos
+
+
+def test_repeticion_exacta_se_sube_una_vez():
+    registros = [('ene.csv:2', factura(1.0)), ('ene.csv:3', factura(1.0, importado_desde='OTRO'))]
+    filas, conflictos, repetidos = deduplicar(registros)
+    assert len(filas) == 1
+    assert conflictos == []
+    assert repetidos == 1
+
+
+def test_ultimo_respeta_la_repeticion_mas_reciente():
+    # A, B, A: la descarga más nueva vuelve a traer la versión A
+    registros = [
+        ('ene.csv:2', factura(1.0)),
+        ('feb.csv:2', factura(2.0)),
+        ('mar.csv:2', factura(1.0)),
+    ]
+    filas, conflictos, repetidos = deduplicar(registros, politica='ultimo')
+    assert [f['monto_total'] for f in filas] == [1.0]
+    assert repetidos == 1
+    subida = [c for c in conflictos if c['resolucion'] == 'SUBIDA']
+    assert subida[0]['origen'] == 'ene.csv:2, mar.csv:2'
+
+
+def test_primero_y_conflicto():
+    registros = [('ene.csv:2', factura(1.0)), ('feb.csv:2', factura(2.0))]
+    filas, conflictos, _ = deduplicar(registros, politica='primero')
+    assert [f['monto_total'] for f in filas] == [1.0]
+    assert documentos_retenidos(conflictos) == set()
+
+    filas, conflictos, _ = deduplicar(registros, politica='conflicto')
+    assert filas == []
+    assert [c['resolucion'] for c in conflictos] == ['DESCARTADA', 'DESCARTADA']
+    assert documentos_retenidos(conflictos) == {('85.655.500-3', 33, 266728)}
+
+
+def test_informe_muestra_el_campo_que_difiere(tmp_path):
+    registros = [
+        ('ene.csv:2', factura(1.0)),
+        ('feb.csv:2', factura(1.0, razon_social_emisor='DISTRIBUIDORA FURET SPA')),
+    ]
+    _, conflictos, _ = deduplicar(registros)
+    ruta = tmp_path / 'conflictos.csv'
+    escribir_informe(conflictos, ruta)
+
+    with open(ruta, newline='', encoding='latin1') as f:
+        filas = list(csv.DictReader(f, delimiter=';'))
+    assert [f['razon_social_emisor'] for f in filas] == ['DISTRIBUIDORA FURET LTDA.', 'DISTRIBUIDORA FURET SPA']
+    assert filas[-1]['resolucion'] == 'SUBIDA'
@@ -0,0 +1,157 @@
+import gzip
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+import pytest
+
+from transporte_supabase import ErrorSupabase, TransporteSupabase, _decimal_env, _entero_env
+
+LLAVE = 'rut_emisor,tipo_dte,folio'
+
+
+def facturas(n, malas=()):
+    return [{'folio': i, 'rut_emisor': None if i in malas else '1-9', 'tipo_dte': 33} for i in range(n)]
+
+
+def leer(request):
+    cuerpo = request.content
+    if request.headers.get('content-encoding') == 'gzip':
+        cuerpo = gzip.decompress(cuerpo)
+    return json.loads(cuerpo)
+
+
+def postgrest(request):
+    """Imita PostgREST: rechaza el lote entero si alguna fila trae rut_emisor nulo"""
+    filas = leer(request)
+    if any(f['rut_emisor'] is None for f in filas):
+        return httpx.Response(400, json={'code': '23502', 'message': 'null value in column "rut_emisor"'})
+    return httpx.Response(201, json=[{'folio': f['folio']} for f in filas])
+
+
+def transporte_con(handler, **kwargs):
+    peticiones = []
+
+    def registrar(request):
+        peticiones.append(request)
+        return handler(request)
+
+    kwargs.setdefault('gzip_min_bytes', 0)
+    transporte = TransporteSupabase('http://supabase.test', 'llave',
+                                    transport=httpx.MockTransport(registrar), **kwargs)
+    return transporte, peticiones
+
+
+def test_lote_con_filas_malas_se_divide_hasta_aislarlas():
+    transporte, peticiones = transporte_con(postgrest)
+    filas = facturas(8, malas=(3,))
+
+    insertadas, fallidas = transporte.insertar_en_lotes('compras_sii', filas, on_conflict=LLAVE,
+                                                        columna_retorno='folio')
+
+    assert insertadas == 7
+    assert [fila['folio'] for fila, _ in fallidas] == [3]
+    assert 'HTTP 400' in fallidas[0][1]
+    # 8 → 4+4 → 2+2 → 1+1: 1 + 2 + 2 + 2 peticiones
+    assert len(peticiones) == 7
+    # el JSON del lote se cuenta una sola vez aunque se haya dividido
+    assert transporte.estadisticas['bytes_json'] == len(transporte._serializar(filas))
+
+
+@pytest.mark.parametrize('status', [401, 403, 404, 500, 503])
+def test_error_que_no_es_de_una_fila_detiene_la_corrida(status):
+    transporte, peticiones = transporte_con(lambda r: httpx.Response(status, json={'message': 'no'}))
+
+    with pytest.raises(ErrorSupabase) as error:
+        transporte.insertar_en_lotes('compras_sii', facturas(1000), tamano_lote=500)
+
+    assert error.value.status == status
+    assert len(peticiones) == 1
+    assert transporte.estadisticas['errores'] == 1
+
+
+def test_sin_conexion_detiene_la_corrida_y_cuenta_el_error():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        puerto = s.getsockname()[1]
+    transporte = TransporteSupabase(f'http://127.0.0.1:{puerto}', 'llave', connect_timeout=1.0)
+
+    with pytest.raises(httpx.ConnectError):
+        transporte.insertar_en_lotes('compras_sii', facturas(500))
+
+    assert transporte.estadisticas['peticiones'] == 1
+    assert transporte.estadisticas['errores'] == 1
+    assert '1 errores' in transporte.resumen()
+
+
+def test_gzip_rechazado_se_desactiva_para_el_resto_del_proceso():
+    def sin_gzip(request):
+        if request.headers.get('content-encoding') == 'gzip':
+            return httpx.Response(415, json={'message': 'Unsupported Media Type'})
+        return postgrest(request)
+
+    transporte, peticiones = transporte_con(sin_gzip, gzip_min_bytes=1)
+
+    assert transporte.insertar('compras_sii', facturas(10), columna_retorno='folio') == 10
+    assert transporte.insertar('compras_sii', facturas(10), columna_retorno='folio') == 10
+
+    assert [p.headers.get('content-encoding') for p in peticiones] == ['gzip', None, None]
+    assert transporte.gzip_aceptado is False
+    assert transporte.gzip_min_bytes == 0
+
+
+def test_error_de_datos_en_lote_comprimido_no_se_reenvia_en_plano():
+    transporte, peticiones = transporte_con(postgrest, gzip_min_bytes=1)
+
+    insertadas, fallidas = transporte.insertar_en_lotes('compras_sii', facturas(2, malas=(0,)),
+                                                        columna_retorno='folio')
+
+    assert (insertadas, len(fallidas)) == (1, 1)
+    assert all(p.headers.get('content-encoding') == 'gzip' for p in peticiones)
+    assert len(peticiones) == 3
+    assert transporte.gzip_aceptado is True
+
+
+class _Servidor(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_pool_reutiliza_la_conexion():
+    servidor = HTTPServer(('127.0.0.1', 0), _Servidor)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        transporte = TransporteSupabase(f'http://127.0.0.1:{servidor.server_port}', 'llave')
+        for _ in range(3):
+            transporte.insertar('compras_sii', facturas(5))
+        transporte.cerrar()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    assert transporte.estadisticas['peticiones'] == 3
+    assert transporte.estadisticas['conexiones_abiertas'] == 1
+
+
+def test_variables_de_entorno(monkeypatch):
+    monkeypatch.setenv('SUPABASE_POOL_MAX', '8')
+    monkeypatch.setenv('SUPABASE_TIMEOUT', '2.5')
+    monkeypatch.setenv('SUPABASE_GZIP_MIN_BYTES', 'mucho')
+    monkeypatch.setenv('SUPABASE_CONNECT_TIMEOUT', ' ')
+
+    assert _entero_env('SUPABASE_POOL_MAX', 4) == 8
+    assert _decimal_env('SUPABASE_TIMEOUT', 60.0) == 2.5
+    assert _entero_env('SUPABASE_GZIP_MIN_BYTES', 16384) == 16384
+    assert _decimal_env('SUPABASE_CONNECT_TIMEOUT', 10.0) == 10.0
+    assert _entero_env('SUPABASE_NO_DEFINIDA', 2) == 2
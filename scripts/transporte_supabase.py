@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+PLUS CONTROL - TRANSPORTE HTTP HACIA SUPABASE
+=============================================
+Capa de transporte compartida por los scripts de importación.
+
+Mantiene UN solo pool de conexiones keep-alive por proceso contra la API
+REST de Supabase (PostgREST), comprime con gzip los lotes grandes y lleva
+contadores de peticiones y conexiones para ver cuánto se gasta en red.
+
+Configuración (variables de entorno o scripts/.env):
+    SUPABASE_URL              URL del proyecto (obligatoria)
+    SUPABASE_KEY              Llave service_role (obligatoria)
+    SUPABASE_TIMEOUT          Timeout de lectura/escritura en segundos (60)
+    SUPABASE_CONNECT_TIMEOUT  Timeout de conexión en segundos (10)
+    SUPABASE_POOL_MAX         Máximo de conexiones simultáneas (4)
+    SUPABASE_POOL_KEEPALIVE   Conexiones ociosas que se mantienen abiertas (2)
+    SUPABASE_GZIP_MIN_BYTES   Cuerpos desde este tamaño van comprimidos (16384).
+                              Con 0 se desactiva la compresión.
+
+Compresión: no está verificado que el gateway de Supabase o PostgREST
+descompriman cuerpos con Content-Encoding: gzip. Se decide con el primer
+lote comprimido: si vuelve 415, o 400 sin código de error de Postgres
+(cuerpo ilegible), se reenvía sin comprimir y, si así pasa, la compresión
+queda desactivada por el resto del proceso. Una vez que el servidor
+aceptó un cuerpo comprimido no se vuelve a probar.
+
+Lotes: si un lote falla por los datos de alguna fila (400, 409, 422) se
+divide en mitades hasta aislar las filas malas, así una fila inválida no
+se lleva consigo a las otras 499. Cualquier otro error (401/403/404, 5xx,
+sin conexión, timeout) afecta a todas las filas por igual: se lanza de
+inmediato y la corrida se detiene.
+
+Uso:
+    from transporte_supabase import obtener_transporte
+
+    transporte = obtener_transporte()
+    transporte.insertar('compras_sii', filas, on_conflict='rut_emisor,tipo_dte,folio')
+    print(transporte.resumen())
+"""
+
+import atexit
+import gzip
+import json
+import os
+import sys
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+ruta_script = Path(__file__).parent
+load_dotenv(dotenv_path=ruta_script / '.env')
+
+TAMANO_LOTE = 500
+# Estados en que el servidor rechaza los datos de alguna fila, no la petición
+ESTADOS_POR_FILA = (400, 409, 422)
+
+
+def _entero_env(nombre, defecto):
+    valor = os.getenv(nombre)
+    if valor is None or valor.strip() == '':
+        return defecto
+    try:
+        return int(valor)
+    except ValueError:
+        print(f"⚠️ {nombre}='{valor}' no es un entero, usando {defecto}")
+        return defecto
+
+
+def _decimal_env(nombre, defecto):
+    valor = os.getenv(nombre)
+    if valor is None or valor.strip() == '':
+        return defecto
+    try:
+        return float(valor)
+    except ValueError:
+        print(f"⚠️ {nombre}='{valor}' no es un número, usando {defecto}")
+        return defecto
+
+
+class ErrorSupabase(Exception):
+    """Respuesta de error de la API REST de Supabase"""
+
+    def __init__(self, status, detalle):
+        super().__init__(f"HTTP {status}: {detalle}")
+        self.status = status
+        self.detalle = detalle
+
+
+# Errores que detienen una importación (todo lo que no es culpa de una fila)
+ERRORES_TRANSPORTE = (ErrorSupabase, httpx.HTTPError)
+
+
+class TransporteSupabase:
+    """Cliente HTTP con pool keep-alive, gzip y contadores"""
+
+    def __init__(self, url, key, timeout=60.0, connect_timeout=10.0,
+                 pool_max=4, pool_keepalive=2, gzip_min_bytes=16384, transport=None):
+        self.gzip_min_bytes = gzip_min_bytes
+        # None hasta que el servidor conteste al primer cuerpo comprimido
+        self.gzip_aceptado = None
+        self.estadisticas = {
+            'peticiones': 0,
+            'peticiones_comprimidas': 0,
+            'conexiones_abiertas': 0,
+            'errores': 0,
+            'bytes_json': 0,
+            'bytes_enviados': 0,
+        }
+        self._cliente = httpx.Client(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={
+                'apikey': key,
+                'Authorization': f"Bearer {key}",
+                'Content-Type': 'application/json',
+                'Accept-Encoding': 'gzip',
+            },
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_max,
+                max_keepalive_connections=pool_keepalive,
+            ),
+            event_hooks={'request': [self._instrumentar]},
+            transport=transport,
+        )
+
+    def _instrumentar(self, request):
+        # httpcore avisa por "trace" cada vez que abre un socket nuevo;
+        # si el pool reutiliza una conexión, este evento no aparece.
+        request.extensions['trace'] = self._trazar
+        self.estadisticas['peticiones'] += 1
+
+    def _trazar(self, evento, info):
+        if evento == 'connection.connect_tcp.complete':
+            self.estadisticas['conexiones_abiertas'] += 1
+
+    def _serializar(self, filas):
+        return json.dumps(filas, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def _detalle(self, respuesta):
+        """(código, mensaje) de una respuesta de error de PostgREST"""
+        try:
+            cuerpo = respuesta.json()
+        except ValueError:
+            return '', respuesta.text
+        if not isinstance(cuerpo, dict):
+            return '', respuesta.text
+        return str(cuerpo.get('code') or ''), cuerpo.get('message', respuesta.text)
+
+    def _rechazo_por_compresion(self, respuesta):
+        if respuesta.status_code == 415:
+            return True
+        if respuesta.status_code != 400:
+            return False
+        # Los errores de datos traen un SQLSTATE de Postgres (23502, 22P02...);
+        # un cuerpo que no se pudo leer llega como PGRST1xx o sin JSON
+        codigo, _ = self._detalle(respuesta)
+        return codigo == '' or codigo.startswith('PGRST1')
+
+    def _post(self, tabla, cuerpo, params, headers):
+        self.estadisticas['bytes_enviados'] += len(cuerpo)
+        try:
+            return self._cliente.post(f"/{tabla}", content=cuerpo, params=params, headers=headers)
+        except httpx.HTTPError:
+            self.estadisticas['errores'] += 1
+            raise
+
+    def _verificar(self, respuesta):
+        if respuesta.status_code >= 400:
+            self.estadisticas['errores'] += 1
+            _, detalle = self._detalle(respuesta)
+            raise ErrorSupabase(respuesta.status_code, detalle)
+        return respuesta
+
+    def _enviar(self, tabla, filas, json_filas, on_conflict=None, columna_retorno=None):
+        params = {}
+        preferencias = []
+        if on_conflict:
+            params['on_conflict'] = on_conflict
+            preferencias.append('resolution=ignore-duplicates')
+        if columna_retorno:
+            params['select'] = columna_retorno
+            preferencias.append('return=representation')
+        else:
+            preferencias.append('return=minimal')
+        headers = {'Prefer': ','.join(preferencias)}
+
+        if self.gzip_min_bytes and len(json_filas) >= self.gzip_min_bytes:
+            self.estadisticas['peticiones_comprimidas'] += 1
+            respuesta = self._post(tabla, gzip.compress(json_filas, compresslevel=6), params,
+                                   {**headers, 'Content-Encoding': 'gzip'})
+            if self.gzip_aceptado is None:
+                if self._rechazo_por_compresion(respuesta):
+                    # Puede que el servidor no acepte cuerpos comprimidos: reintentar en plano
+                    respuesta = self._post(tabla, json_filas, params, headers)
+                    if not self._rechazo_por_compresion(respuesta):
+                        print("⚠️ El servidor rechazó el cuerpo comprimido; se desactiva gzip para esta corrida")
+                        self.gzip_aceptado = False
+                        self.gzip_min_bytes = 0
+                else:
+                    self.gzip_aceptado = True
+        else:
+            respuesta = self._post(tabla, json_filas, params, headers)
+
+        self._verificar(respuesta)
+        if columna_retorno:
+            return len(respuesta.json())
+        return len(filas)
+
+    def insertar(self, tabla, filas, on_conflict=None, columna_retorno=None):
+        """
+        Inserta una lista de filas en una sola petición.
+
+        Con on_conflict las filas que ya existen se ignoran en el servidor
+        (ON CONFLICT DO NOTHING) en vez de tumbar el lote completo.
+        Devuelve la cantidad de filas realmente insertadas si se indica
+        columna_retorno; si no, la cantidad enviada.
+        """
+        if not filas:
+            return 0
+        json_filas = self._serializar(filas)
+        self.estadisticas['bytes_json'] += len(json_filas)
+        return self._enviar(tabla, filas, json_filas, on_conflict, columna_retorno)
+
+    def _insertar_o_dividir(self, tabla, filas, fallidas, json_filas=None, **kwargs):
+        if json_filas is None:
+            json_filas = self._serializar(filas)
+        try:
+            return self._enviar(tabla, filas, json_filas, **kwargs)
+        except ErrorSupabase as e:
+            if e.status not in ESTADOS_POR_FILA:
+                raise
+            if len(filas) == 1:
+                fallidas.append((filas[0], str(e)))
+                return 0
+            mitad = len(filas) // 2
+            return (self._insertar_o_dividir(tabla, filas[:mitad], fallidas, **kwargs)
+                    + self._insertar_o_dividir(tabla, filas[mitad:], fallidas, **kwargs))
+
+    def insertar_en_lotes(self, tabla, filas, tamano_lote=TAMANO_LOTE, **kwargs):
+        """
+        Divide filas en lotes y devuelve (insertadas, fallidas).
+
+        fallidas es una lista de (fila, error) con las filas que el servidor
+        rechazó; cada lote que falla por sus datos se parte en mitades hasta
+        aislarlas. Los errores que no son de una fila (ERRORES_TRANSPORTE)
+        se lanzan sin seguir con los lotes restantes.
+        """
+        insertadas = 0
+        fallidas = []
+        for inicio in range(0, len(filas), tamano_lote):
+            lote = filas[inicio:inicio + tamano_lote]
+            json_lote = self._serializar(lote)
+            self.estadisticas['bytes_json'] += len(json_lote)
+            insertadas += self._insertar_o_dividir(tabla, lote, fallidas, json_filas=json_lote, **kwargs)
+        for fila, error in fallidas:
+            print(f"   ⚠️ Factura {fila.get('folio')} ({fila.get('rut_emisor')}) rechazada: {error}")
+        return insertadas, fallidas
+
+    def resumen(self):
+        e = self.estadisticas
+        ahorro = ''
+        if e['bytes_json'] and e['bytes_enviados'] < e['bytes_json']:
+            ahorro = f" ({100 * (1 - e['bytes_enviados'] / e['bytes_json']):.0f}% menos)"
+        return (
+            f"📡 Red: {e['peticiones']} peticiones "
+            f"({e['peticiones_comprimidas']} comprimidas), "
+            f"{e['conexiones_abiertas']} conexiones abiertas, {e['errores']} errores, "
+            f"{e['bytes_enviados']:,} de {e['bytes_json']:,} bytes enviados{ahorro}"
+        )
+
+    def cerrar(self):
+        self._cliente.close()
+
+
+_transporte = None
+
+
+def obtener_transporte():
+    """Devuelve el transporte del proceso, creándolo desde el entorno la primera vez"""
+    global _transporte
+    if _transporte is not None:
+        return _transporte
+
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        print("❌ ERROR: Faltan SUPABASE_URL o SUPABASE_KEY en el entorno o en 'scripts/.env'")
+        sys.exit(1)
+
+    _transporte = TransporteSupabase(
+        url,
+        key,
+        timeout=_decimal_env("SUPABASE_TIMEOUT", 60.0),
+        connect_timeout=_decimal_env("SUPABASE_CONNECT_TIMEOUT", 10.0),
+        pool_max=_entero_env("SUPABASE_POOL_MAX", 4),
+        pool_keepalive=_entero_env("SUPABASE_POOL_KEEPALIVE", 2),
+        gzip_min_bytes=_entero_env("SUPABASE_GZIP_MIN_BYTES", 16384),
+    )
+    atexit.register(_transporte.cerrar)
+    return _transporte